@@ -2,7 +2,9 @@
 """
 # %% Setup
 # stdlib
-from typing import Callable
+from typing import Callable, Union
+from functools import lru_cache
+from contextlib import asynccontextmanager
 from time import monotonic
 from datetime import datetime
 from itertools import chain
@@ -17,8 +19,10 @@ import polars as pl
 from .constants import *
 
 
-# configuration
-asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+# Built once and reused for every (symbol, interval) frame
+KLINE_SLICE = slice(KLINE_FIELDS_START, KLINE_FIELDS_END)
+KLINE_SLICE_FIELDS = tuple(KLINE_FIELDS[KLINE_SLICE])
+KLINE_CAST = [pl.col(field).cast(pl.datatypes.Float64) for field in ('Open', 'High', 'Low', 'Close', 'Volume')]
 
 
 class RateLimiter:
@@ -30,54 +34,81 @@ class RateLimiter:
         self.tokens = self.MAX_TOKENS
         self.updated_at = monotonic()
 
+    @asynccontextmanager
     async def get(self, *args, **kwargs):
         await self.wait_for_token()
-        return self.client.get(*args, **kwargs)
+        async with self.client.get(*args, **kwargs) as resp:
+            yield resp
 
     async def wait_for_token(self):
-        while self.tokens <= 1:
-            self.add_new_tokens()
-            await asyncio.sleep(1)
+        # Reserve the token before sleeping so concurrent callers queue up behind the deficit
+        # instead of polling, and sleep exactly until it is paid back
+        self.add_new_tokens()
         self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.RATE)
 
     def add_new_tokens(self):
         now = monotonic()
         time_since_update = now - self.updated_at
         new_tokens = time_since_update * self.RATE
-        if self.tokens + new_tokens >= 1:
-            self.tokens = min(self.tokens + new_tokens, self.MAX_TOKENS)
-            self.updated_at = now
+        self.tokens = min(self.tokens + new_tokens, self.MAX_TOKENS)
+        self.updated_at = now
+
+
+_UNIT_MINUTES = {'m': 1, 'h': 60, 'd': 24 * 60, 'w': 7 * 24 * 60, 'M': 30 * 24 * 60}
 
 
 def get_total_minutes(interval):
-    if interval[-1] == 'm':
-        time = int(interval[:-1])
+    return int(interval[:-1]) * _UNIT_MINUTES[interval[-1]]
 
-    if interval[-1] == 'h':
-        time = 60 * int(interval[:-1])
 
-    if interval[-1] == 'd':
-        time = 24 * 60 * int(interval[:-1])
+@lru_cache(maxsize=1024)
+def _parse_datetime(timestamp: str) -> datetime:
+    return datetime.strptime(timestamp, DATETIME_FORMAT)
 
-    if interval[-1] == 'w':
-        time = 7 * 24 * 60 * int(interval[:-1])
 
-    if interval[-1] == 'M':
-        time = 30 * 24 * 60 * int(interval[:-1])
+def to_epoch_ms(timestamp: Union[int, datetime, str]) -> int:
+    # Only strings are parsed; datetimes and epoch-ms integers are used as-is
+    if isinstance(timestamp, str):
+        timestamp = _parse_datetime(timestamp)
 
-    return time
+    if isinstance(timestamp, datetime):
+        return int(timestamp.timestamp() * 1000)
+
+    return timestamp
 
 class BinanceClient:
     def __init__(self, logger: Callable = None):
         self.logger = logger
+        self.session = None
+        self._client_session = None
+
+    async def __aenter__(self):
+        # A single pooled session (and rate limiter) is shared by every request made through the client
+        self._client_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=64, ttl_dns_cache=300, keepalive_timeout=75),
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+        self.session = RateLimiter(self._client_session)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await self._client_session.close()
+        self.session = None
+        self._client_session = None
 
     @staticmethod
     def _parse_symbol_data(info_df: pl.DataFrame, data_df: pl.DataFrame):
-        info_df = info_df.filter(pl.col('quoteAsset').str.contains('BTC|USDT'))
+        # Filter and project both sides before joining so the join only touches relevant rows/columns
+        info_df = (info_df
+                   .filter(pl.col('quoteAsset').is_in(['BTC', 'USDT']))
+                   .select(['symbol', 'baseAsset', 'quoteAsset'])
+                   )
+        data_df = data_df.select(['symbol', 'weightedAvgPrice', 'volume'])
 
         df = (info_df
               .join(data_df, on='symbol')
-              .select(['symbol', 'baseAsset', 'quoteAsset', 'weightedAvgPrice', 'volume'])
               .with_column((pl.col('weightedAvgPrice').cast(pl.datatypes.Float64) *
                             pl.col('volume').cast(pl.datatypes.Float64)).alias('liquidity'))
               .filter(pl.col('liquidity') > 0)
@@ -86,103 +117,93 @@ class BinanceClient:
         return df
 
     async def get_all_symbol_data(self, session):
-        from .functional import (get_info, get_ticker)
-
         futures = (
-            get_info(session=session), 
-            get_ticker(session=session)
+            functional.get_info(session=session), 
+            functional.get_ticker(session=session)
         )
 
         ticker_info, ticker_data = await asyncio.gather(*futures)
 
-        for record in ticker_info['symbols']:
-            for field in SYMBOL_INFO_JSON_FIELDS:
-                record[field] = str(record[field])
-
-        info_df = pl.from_dicts(dicts=ticker_info['symbols']).lazy()
+        # Only the used fields are collected, so the nested JSON fields (orderTypes, filters, ...) are never converted
+        symbols = ticker_info['symbols']
+        info_df = pl.DataFrame({field: [record[field] for record in symbols] for field in SYMBOL_INFO_FIELDS}).lazy()
         data_df = pl.from_dicts(dicts=ticker_data).lazy()
 
         return self._parse_symbol_data(info_df, data_df).collect()
 
-    async def get_all_klines(self, session, symbol: str, interval: str, start_time: int = None, end_time: int = None):
+    async def get_all_klines(
+        self,
+        session,
+        symbol: str,
+        interval: str,
+        start_time: Union[int, datetime, str] = None,
+        end_time: Union[int, datetime, str] = None
+    ):
         # Determine the number of 1000 `interval` timestamps required
-        if start_time and end_time is not None:
-            start_time = int(datetime.strptime(start_time, DATETIME_FORMAT).timestamp()) * 1000
-            end_time = int(datetime.strptime(end_time, DATETIME_FORMAT).timestamp()) * 1000
+        start_time = to_epoch_ms(start_time)
+        end_time = to_epoch_ms(end_time)
 
-        times = [(start_time, start_time + 1000 * 60 * 1000)]
-        while True:
-            times.append((times[-1][-1], times[-1][-1] + 1000 * 60 * 1000))
-            if times[-1][-1] > end_time:
-                break
+        # Each request returns at most 1000 bars, so tile the range in windows of 1000 `interval`s (in ms)
+        step = 1000 * get_total_minutes(interval) * 60 * 1000
+        times = [(start, start + step) for start in range(start_time, end_time, step)]
 
         async def wrap_kline_request(symbol, interval, times):
-            from .functional import get_klines
+            # Cap in-flight requests so long backfills don't buffer thousands of responses at once
+            semaphore = asyncio.Semaphore(32)
 
-            tasks = []
-            for start_time, end_time in times:
-                future = asyncio.ensure_future(
-                    get_klines(
+            async def bounded_request(start_time, end_time):
+                async with semaphore:
+                    return await functional.get_klines(
                         session=session,
                         symbol=symbol,
                         interval=interval,
                         start_time=start_time,
                         end_time=end_time
                     )
-                )
-                tasks.append(future)
+
+            tasks = [bounded_request(start_time=start_time, end_time=end_time) for start_time, end_time in times]
 
             return await asyncio.gather(*tasks)
 
         klines = await wrap_kline_request(symbol=symbol, interval=interval, times=times)
         klines = list(chain.from_iterable(klines))
-        klines = [{field: value for field, value in zip(KLINE_FIELDS, record[KLINE_FIELDS_START:KLINE_FIELDS_END])}
-                  for record in klines]
 
         if len(klines) == 0:
             return
 
-        kline_df = self.process_klines(kline_dict=klines)
+        # Transpose the row-oriented payload into one sequence per field
+        kline_columns = zip(*(record[KLINE_SLICE] for record in klines))
+        kline_df = self.process_klines(kline_columns=kline_columns)
 
         return kline_df
 
     @staticmethod
-    def process_klines(kline_dict):
-        kline_df = pl.from_dicts(kline_dict).lazy()
+    def process_klines(kline_columns):
+        kline_series = [pl.Series(field, column, dtype=KLINE_DTYPES[field])
+                        for field, column in zip(KLINE_SLICE_FIELDS, kline_columns)]
+
+        # Epoch-ms integers are reinterpreted as millisecond datetimes, no parsing is involved
+        kline_series = [series.cast(KLINE_TIME_DTYPE) if series.name in KLINE_TIME_FIELDS else series
+                        for series in kline_series]
+
+        kline_df = pl.DataFrame(kline_series).lazy()
         kline_df = (kline_df
-                    .with_column(pl.col('Open time').cast(pl.datatypes.Datetime))
-                    .with_column(pl.col('Close time').cast(pl.datatypes.Datetime))
-                    .with_column(pl.col('Open').cast(pl.datatypes.Float64))
-                    .with_column(pl.col('High').cast(pl.datatypes.Float64))
-                    .with_column(pl.col('Low').cast(pl.datatypes.Float64))
-                    .with_column(pl.col('Close').cast(pl.datatypes.Float64))
-                    .with_column(pl.col('Volume').cast(pl.datatypes.Float64))
+                    .with_columns(KLINE_CAST)
                     .collect()
                     )
 
         return kline_df
 
-    async def async_get_kline_data(self, symbol, interval, start_time, end_time):
-        async with aiohttp.ClientSession() as session:
-            session = RateLimiter(session)
-            kline_df = await self.get_all_klines(
-                session=session,
-                symbol=symbol,
-                interval=interval,
-                start_time=start_time,
-                end_time=end_time
-            )
-        return kline_df
+    def _require_session(self):
+        if self.session is None:
+            raise RuntimeError("BinanceClient has no open session, use it as `async with BinanceClient() as client:`")
 
-    async def async_get_all_symbol_data(self):
-        async with aiohttp.ClientSession() as session:
-            session = RateLimiter(session)
-            exchange_df = await self.get_all_symbol_data(session=session)
-
-        return exchange_df
+        return self.session
 
     async def get_kline_data(self, symbol, interval, start_time, end_time) -> pl.DataFrame:
-        return await self.async_get_kline_data(
+        session = self._require_session()
+        return await self.get_all_klines(
+            session=session,
             symbol=symbol,
             interval=interval,
             start_time=start_time,
@@ -190,4 +211,10 @@ class BinanceClient:
         )
 
     async def get_exchange_data(self) -> pl.DataFrame:
-        return await self.async_get_all_symbol_data()
\ No newline at end of file
+        session = self._require_session()
+        return await self.get_all_symbol_data(session=session)
+
+
+# `functional` imports `BinanceClient` from this module, so it is bound once the class exists and its
+# request functions are resolved as module attributes at call time
+from . import functional
@@ -1,7 +1,11 @@
 """Binance API constants
 """
+# 3rd party
+import polars as pl
+
+
 BASE_URL = f"""https://api.binance.com/api/v3"""
-SYMBOL_INFO_JSON_FIELDS = ["orderTypes", "filters", "permissions"]
+SYMBOL_INFO_FIELDS = ["symbol", "baseAsset", "quoteAsset"]
 
 KLINE_FIELDS = [
     "Open time",
@@ -14,6 +18,19 @@ KLINE_FIELDS = [
 ]
 KLINE_FIELDS_START, KLINE_FIELDS_END = 0, 7
 
+# Binance returns kline timestamps as epoch-millisecond integers and prices/volumes as strings
+KLINE_DTYPES = {
+    "Open time": pl.Int64,
+    "Open": pl.Utf8,
+    "High": pl.Utf8,
+    "Low": pl.Utf8,
+    "Close": pl.Utf8,
+    "Volume": pl.Utf8,
+    "Close time": pl.Int64
+}
+KLINE_TIME_FIELDS = ("Open time", "Close time")
+KLINE_TIME_DTYPE = pl.Datetime("ms")
+
 DEFAULT_START_TIME = "2016-01-01 00:00:00.000000"
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
 
@@ -2,9 +2,11 @@
 """
 # %% Setup
 # stdlib
-from typing import List, Optional
+from typing import List, Optional, Union
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime
+
+import asyncio
 
 # 3rd party
 import polars as pl
@@ -19,13 +21,13 @@ from .constants import *
 # %% General utilities
 def create_empty_schema():
     data = [
-        pl.Series("Open time", [], dtype=pl.Datetime),
+        pl.Series("Open time", [], dtype=KLINE_TIME_DTYPE),
         pl.Series("Open", [], dtype=pl.Float64),
         pl.Series("High", [], dtype=pl.Float64),
         pl.Series("Low", [], dtype=pl.Float64),
         pl.Series("Close", [], dtype=pl.Float64),
         pl.Series("Volume", [], dtype=pl.Float64),
-        pl.Series("Close time", [], dtype=pl.Datetime)
+        pl.Series("Close time", [], dtype=KLINE_TIME_DTYPE)
     ]
 
     return pl.DataFrame(data)
@@ -40,42 +42,82 @@ def print_logger(timestamp: datetime, message: str, rows: Optional[int] = None):
 async def update_kline_data(
     symbol: str, 
     save_dir: Path, 
-    default_start: str = DEFAULT_START_TIME,
-    interval: str = INTERVAL_1_MINUTE
+    default_start: Union[int, datetime, str] = DEFAULT_START_TIME,
+    interval: str = INTERVAL_1_MINUTE,
+    *,
+    client: Optional[BinanceClient] = None
 ):
-    with Loader(f"Fetching all data for {symbol} | {interval}..."):
-        save_path = save_dir / f"datasets"
-        if not save_path.exists():
-            save_path.mkdir(parents=True)
-
-        try:
-            kline_df = pl.read_parquet(source=save_path / f"{symbol}_{interval}.parquet")
-            start_time = str(datetime.fromtimestamp(kline_df["Close time"].max() / 1e3) + timedelta(milliseconds=1)) + ".000000"
-        except FileNotFoundError:
-            #logger(timestamp=datetime.now(), message=f"Fetching all data for {symbol}")
-            kline_df = create_empty_schema()
-            start_time = default_start
-
-        end_time = str(datetime.now())
-
-        client = BinanceClient()
-
-        kline_df_ = await client.get_kline_data(
-            symbol=symbol,
-            interval=interval,
-            start_time=start_time,
-            end_time=end_time
-        )
+    if client is None:
+        async with BinanceClient() as client:
+            return await update_kline_data(
+                symbol=symbol,
+                save_dir=save_dir,
+                default_start=default_start,
+                interval=interval,
+                client=client
+            )
 
-        print_logger(
-            timestamp=datetime.now(),
-            message=f"Fetched data for {symbol} | {interval} | {start_time} to {end_time}",
-            rows=len(kline_df_) if kline_df_ is not None else None
+    save_path = save_dir / f"datasets"
+    if not save_path.exists():
+        save_path.mkdir(parents=True)
+
+    kline_path = save_path / f"{symbol}_{interval}.parquet"
+
+    if kline_path.exists():
+        # Only the Close time column is read to find the resume point
+        # Older datasets were written as Datetime('us') columns holding epoch-ms values; reinterpreting the raw
+        # integers as Datetime('ms') migrates those and leaves files in the current layout unchanged
+        kline_lf = pl.scan_parquet(kline_path).with_columns([
+            pl.col(field).cast(pl.Int64).cast(KLINE_TIME_DTYPE) for field in KLINE_TIME_FIELDS
+        ])
+        last_close_time = kline_lf.select(pl.col("Close time").cast(pl.Int64).max()).collect()[0, 0]
+        start_time = last_close_time + 1
+    else:
+        #logger(timestamp=datetime.now(), message=f"Fetching all data for {symbol}")
+        kline_lf = create_empty_schema().lazy()
+        last_close_time = None
+        start_time = default_start
+
+    end_time = datetime.now()
+
+    kline_df_ = await client.get_kline_data(
+        symbol=symbol,
+        interval=interval,
+        start_time=start_time,
+        end_time=end_time
+    )
+
+    # `start_time` is an epoch-ms int when resuming, log it as a datetime like `end_time`
+    start_display = datetime.fromtimestamp(start_time / 1000) if isinstance(start_time, int) else start_time
+
+    print_logger(
+        timestamp=datetime.now(),
+        message=f"Fetched data for {symbol} | {interval} | {start_display} to {end_time}",
+        rows=len(kline_df_) if kline_df_ is not None else None
+    )
+
+    if kline_df_ is not None:
+        # Merge lazily, write to a temporary file, then swap it in so a failed write never corrupts the dataset
+        tmp_path = kline_path.with_suffix(".parquet.tmp")
+        kline_df_ = kline_df_.unique(subset="Open time", keep="last").sort(by="Open time")
+        merged_lf = pl.concat([kline_lf, kline_df_.lazy()])
+
+        # The stored data is already sorted and unique, so when every new row starts after it
+        # a plain append is enough; only overlapping fetches need the full dedupe and sort
+        if last_close_time is not None and kline_df_["Open time"].cast(pl.Int64).min() <= last_close_time:
+            merged_lf = merged_lf.unique(subset="Open time", keep="last").sort(by="Open time")
+
+        # zstd keeps the file (and the scan above) small; statistics let filtered reads of the dataset skip row groups
+        merged_df = merged_lf.collect()
+        merged_df.write_parquet(
+            tmp_path,
+            compression="zstd",
+            compression_level=3,
+            # polars panics when the row group size exceeds the frame height
+            row_group_size=min(500_000, len(merged_df)),
+            statistics=True
         )
-
-        if kline_df_ is not None:
-            kline_df.vstack(kline_df_, in_place=True)
-            kline_df.sort(by="Open time").distinct().to_parquet(file=save_path / f"{symbol}_{interval}.parquet")
+        tmp_path.replace(kline_path)
 
 
 # %% Update Pipeline
@@ -83,6 +125,7 @@ async def kline_pipeline(
     symbols: Optional[List[str]] = None, 
     save_dir: str = ".data/binance",
     intervals: List[str] = [INTERVAL_1_MINUTE],
+    max_concurrent_updates: int = 4,
 ):
     if isinstance(intervals, str):
         intervals = [intervals]
@@ -90,32 +133,42 @@ async def kline_pipeline(
     save_path = Path(save_dir)
     exchange_save_path = save_path / "exchange.parquet"
 
-    if symbols is None:
-        if not save_path.exists():
-            print_logger(
-                timestamp=datetime.now(),
-                message="Creating a directory for Binance metadata"
-            )
-            save_path.mkdir(parents=True)
+    async with BinanceClient() as client:
+        if symbols is None:
+            if not save_path.exists():
+                print_logger(
+                    timestamp=datetime.now(),
+                    message="Creating a directory for Binance metadata"
+                )
+                save_path.mkdir(parents=True)
 
-        exchange_df = await BinanceClient().get_exchange_data()
-        exchange_df.to_parquet(file=exchange_save_path)
+            exchange_df = await client.get_exchange_data()
+            exchange_df.to_parquet(file=exchange_save_path)
 
-        symbols = exchange_df.sort("liquidity", reverse=True)["symbol"].to_list()
+            symbols = exchange_df.sort("liquidity", reverse=True)["symbol"].to_list()
 
-    for symbol in symbols:
-        for interval in intervals:
-            await update_kline_data(
-                symbol=symbol, 
-                save_dir=save_path, 
-                interval=interval
-            )
+        # Requests are paced by the shared rate limiter. The semaphore bounds how many (symbol, interval)
+        # updates run at once, and each one holds its full fetched history in memory until it is written
+        semaphore = asyncio.Semaphore(max_concurrent_updates)
+
+        async def bounded_update(symbol, interval):
+            async with semaphore:
+                await update_kline_data(
+                    symbol=symbol, 
+                    save_dir=save_path, 
+                    client=client,
+                    interval=interval
+                )
+
+        tasks = [bounded_update(symbol=symbol, interval=interval) for symbol in symbols for interval in intervals]
+        with Loader(f"Fetching all data for {len(symbols)} symbols | {', '.join(intervals)}..."):
+            await asyncio.gather(*tasks)
 
 
 # %% Generic JSON request
 async def _generic_json_request(session, request):
-    async with await session.get(request) as resp:
-        result = await resp.text()
+    async with session.get(request) as resp:
+        result = await resp.read()
     return orjson.loads(result)
 
 
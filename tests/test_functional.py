@@ -0,0 +1,169 @@
+"""Tests for the Binance functional interface, run against a stub session instead of the live API
+"""
+# %% Setup
+# stdlib
+from contextlib import asynccontextmanager
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+
+import asyncio
+
+# 3rd party
+import orjson
+import polars as pl
+
+# custom
+from src.data.binance.client import BinanceClient
+from src.data.binance.functional import update_kline_data
+from src.data.binance.constants import INTERVAL_1_HOUR
+
+
+HOUR_MS = 60 * 60 * 1000
+
+
+# %% Stubs
+class StubResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    async def read(self):
+        return orjson.dumps(self.payload)
+
+
+class StubSession:
+    """Serves hourly klines for every `/klines` request, mimicking Binance's inclusive start/end and 1000 row limit.
+    Other endpoints return the canned payload registered under their path (e.g. `exchangeInfo`)
+    """
+    def __init__(self, responses=None):
+        self.responses = responses or {}
+        self.requests = []
+
+    @asynccontextmanager
+    async def get(self, url):
+        url = urlparse(url)
+        if not url.path.endswith("/klines"):
+            yield StubResponse(self.responses[url.path.split("/api/v3/")[-1]])
+            return
+
+        query = {key: value[0] for key, value in parse_qs(url.query).items()}
+        self.requests.append(query)
+
+        # Like the live API, bars that have not opened yet are never returned
+        start = int(query["startTime"])
+        end = min(int(query["endTime"]), int(datetime.now().timestamp() * 1000))
+        first_open = -(-start // HOUR_MS) * HOUR_MS
+        klines = [
+            [open_time, "1.0", "2.0", "0.5", "1.5", "10.0", open_time + HOUR_MS - 1, "0", 0, "0", "0", "0"]
+            for open_time in range(first_open, end + 1, HOUR_MS)
+        ][:int(query["limit"])]
+
+        yield StubResponse(klines)
+
+
+def make_client(session):
+    client = BinanceClient()
+    client.session = session
+    return client
+
+
+def hours_ago_ms(hours):
+    now = int(datetime.now().timestamp() * 1000) // HOUR_MS * HOUR_MS
+    return now - hours * HOUR_MS
+
+
+# %% update_kline_data
+def test_update_kline_data_creates_dataset(tmp_path):
+    session = StubSession()
+
+    asyncio.run(update_kline_data(
+        symbol="BTCUSDT",
+        save_dir=tmp_path,
+        default_start=hours_ago_ms(48),
+        interval=INTERVAL_1_HOUR,
+        client=make_client(session)
+    ))
+
+    kline_df = pl.read_parquet(tmp_path / "datasets" / "BTCUSDT_1h.parquet")
+
+    assert kline_df.columns == ["Open time", "Open", "High", "Low", "Close", "Volume", "Close time"]
+    assert kline_df["Open time"].dtype == pl.Datetime("ms")
+    assert kline_df["Close"].dtype == pl.Float64
+    assert kline_df["Open time"].cast(pl.Int64).to_list() == list(range(hours_ago_ms(48), hours_ago_ms(0) + 1, HOUR_MS))
+    assert not (tmp_path / "datasets" / "BTCUSDT_1h.parquet.tmp").exists()
+
+
+
+def test_update_kline_data_resumes_after_last_close_time(tmp_path):
+    session = StubSession()
+    for _ in range(2):
+        asyncio.run(update_kline_data(
+            symbol="BTCUSDT",
+            save_dir=tmp_path,
+            default_start=hours_ago_ms(48),
+            interval=INTERVAL_1_HOUR,
+            client=make_client(session)
+        ))
+
+    # The first run already ends with the current bar, so the second one resumes past it and has nothing to fetch
+    kline_df = pl.read_parquet(tmp_path / "datasets" / "BTCUSDT_1h.parquet")
+    assert len(session.requests) == 1
+    assert kline_df["Open time"].cast(pl.Int64).to_list() == list(range(hours_ago_ms(48), hours_ago_ms(0) + 1, HOUR_MS))
+
+
+def test_update_kline_data_migrates_legacy_dataset(tmp_path):
+    # Datasets written before epoch-ms handling stored the raw epoch-ms values in Datetime('us') columns
+    open_times = list(range(hours_ago_ms(48), hours_ago_ms(24), HOUR_MS))
+    legacy_df = pl.DataFrame([
+        pl.Series("Open time", open_times, dtype=pl.Int64).cast(pl.Datetime("us")),
+        *[pl.Series(field, [1.0] * len(open_times), dtype=pl.Float64) for field in ("Open", "High", "Low", "Close", "Volume")],
+        pl.Series("Close time", [open_time + HOUR_MS - 1 for open_time in open_times], dtype=pl.Int64).cast(pl.Datetime("us"))
+    ])
+    (tmp_path / "datasets").mkdir()
+    legacy_df.write_parquet(tmp_path / "datasets" / "BTCUSDT_1h.parquet")
+
+    session = StubSession()
+    asyncio.run(update_kline_data(
+        symbol="BTCUSDT",
+        save_dir=tmp_path,
+        interval=INTERVAL_1_HOUR,
+        client=make_client(session)
+    ))
+
+    kline_df = pl.read_parquet(tmp_path / "datasets" / "BTCUSDT_1h.parquet")
+    assert session.requests[0]["startTime"] == str(hours_ago_ms(24))
+    assert kline_df["Open time"].dtype == pl.Datetime("ms")
+    assert kline_df["Open time"].cast(pl.Int64).to_list() == list(range(hours_ago_ms(48), hours_ago_ms(0) + 1, HOUR_MS))
+
+
+# %% get_exchange_data
+def test_get_exchange_data_keeps_liquid_btc_and_usdt_pairs():
+    def symbol_info(symbol, base, quote):
+        return {
+            "symbol": symbol,
+            "status": "TRADING",
+            "baseAsset": base,
+            "quoteAsset": quote,
+            "orderTypes": ["LIMIT", "MARKET"],
+            "filters": [{"filterType": "PRICE_FILTER", "minPrice": "0.01"}, {"filterType": "LOT_SIZE", "stepSize": "1"}],
+            "permissions": ["SPOT"]
+        }
+
+    session = StubSession(responses={
+        "exchangeInfo": {"symbols": [
+            symbol_info("BTCUSDT", "BTC", "USDT"),
+            symbol_info("ETHBTC", "ETH", "BTC"),
+            symbol_info("ETHBUSD", "ETH", "BUSD"),
+            symbol_info("DEADUSDT", "DEAD", "USDT")
+        ]},
+        "ticker/24hr": [
+            {"symbol": "BTCUSDT", "weightedAvgPrice": "20000.0", "volume": "10.0"},
+            {"symbol": "ETHBTC", "weightedAvgPrice": "0.07", "volume": "100.0"},
+            {"symbol": "ETHBUSD", "weightedAvgPrice": "1500.0", "volume": "100.0"},
+            {"symbol": "DEADUSDT", "weightedAvgPrice": "1.0", "volume": "0.0"}
+        ]
+    })
+
+    exchange_df = asyncio.run(make_client(session).get_exchange_data())
+
+    assert sorted(exchange_df["symbol"].to_list()) == ["BTCUSDT", "ETHBTC"]
+    assert exchange_df.filter(pl.col("symbol") == "BTCUSDT")["liquidity"].to_list() == [200000.0]